@@ -1,34 +1,124 @@
 from flask import Flask, send_from_directory, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from flask_caching import Cache
+from whitenoise import WhiteNoise
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.orm import load_only, raiseload, selectinload
 from database import db
 from models import Employee, Placement, Earning
 from datetime import datetime
+import click
+import functools
+import orjson
 import os
+import re
 
-app = Flask(__name__, static_folder='./build', static_url_path='')
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson; datetimes are emitted in ISO 8601 directly"""
+    
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_SORT_KEYS if self.sort_keys else 0
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+# React build output; served by WhiteNoise below rather than Flask's static route,
+# which would otherwise stat the filesystem for every unmatched URL
+BUILD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'build')
+
+app = Flask(__name__, static_folder=None)
+app.json = OrjsonProvider(app)
 CORS(app)
 
 # Configuration
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///commission_tracker.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    # Serialize JSON columns (commission structures/breakdowns) with orjson
+    'json_serializer': lambda obj: orjson.dumps(obj).decode(),
+    'json_deserializer': orjson.loads
+}
+# Batch multi-row INSERT/UPDATE statements on psycopg2
+if app.config['SQLALCHEMY_DATABASE_URI'].split('://', 1)[0] in ('postgresql', 'postgresql+psycopg2'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS']['executemany_mode'] = 'values_plus_batch'
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
+app.config['CACHE_TYPE'] = os.getenv('CACHE_TYPE', 'SimpleCache')
+app.config['CACHE_REDIS_URL'] = os.getenv('CACHE_REDIS_URL')
 
 db.init_app(app)
+cache = Cache(app)
+
+# Dashboard totals are cached briefly and dropped whenever placements/employees change
+DASHBOARD_CACHE_KEY = 'dashboard_summary'
+
+# Serve the React build straight from WSGI, indexed once at startup
+# (re-scanned per request only when FLASK_DEBUG is set at import time -
+# app.run(debug=True) enables debug too late for this). Fingerprinted
+# bundles under /static/ are cached for a year.
+app.wsgi_app = WhiteNoise(
+    app.wsgi_app,
+    root=BUILD_FOLDER,
+    prefix='',
+    autorefresh=app.debug,
+    immutable_file_test=lambda path, url: url.startswith('/static/')
+)
+
+def upgrade_schema():
+    """Bring databases created before newer columns/indexes up to date"""
+    placement_columns = {column['name'] for column in inspect(db.engine).get_columns('placement')}
+    if 'fee_amount' not in placement_columns:
+        with db.engine.begin() as conn:
+            conn.execute(text('ALTER TABLE placement ADD COLUMN fee_amount FLOAT'))
+            conn.execute(text('UPDATE placement SET fee_amount = starting_salary * fee_percentage'))
+    
+    # create_all() only builds indexes for brand new tables
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
 
 # Create tables
 with app.app_context():
     db.create_all()
+    upgrade_schema()
+
+# ISO-style timestamps: date, optional time with optional fraction, optional Z
+_DT_RE = re.compile(r'^(\d{4})-(\d{2})-(\d{2})(?:[T ](\d{2}):(\d{2}):(\d{2})(?:\.(\d+))?)?Z?$')
 
 def parse_date(date_string):
     """Parse various date string formats"""
     if not date_string:
         return datetime.utcnow()
     
+    parsed = _parse_date_cached(date_string)
+    if parsed is None:
+        # If all else fails, return current time
+        print(f"Could not parse date: {date_string}, using current time")
+        return datetime.utcnow()
+    return parsed
+
+@functools.lru_cache(maxsize=1024)
+def _parse_date_cached(date_string):
+    """Parse a non-empty date string, returning None if no format matches"""
+    # Fast path - match the common formats in a single pass
+    match = _DT_RE.match(date_string)
+    if match:
+        year, month, day, hour, minute, second, fraction = match.groups()
+        microsecond = int(fraction[:6].ljust(6, '0')) if fraction else 0
+        try:
+            return datetime(int(year), int(month), int(day),
+                            int(hour or 0), int(minute or 0), int(second or 0), microsecond)
+        except ValueError:
+            pass
+    
     # Clean the string - remove timezone Z if present
     if date_string.endswith('Z'):
         date_string = date_string[:-1]
     
-    # Try multiple formats
+    # Fall back to multiple formats
     formats = [
         '%Y-%m-%dT%H:%M:%S.%f',  # With milliseconds
         '%Y-%m-%dT%H:%M:%S',     # Without milliseconds
@@ -42,9 +132,24 @@ def parse_date(date_string):
         except ValueError:
             continue
     
-    # If all else fails, return current time
-    print(f"Could not parse date: {date_string}, using current time")
-    return datetime.utcnow()
+    return None
+
+def placement_listing():
+    """SELECT of placement list fields plus employee name, without building ORM objects"""
+    return select(
+        Placement.id,
+        Placement.candidate_name,
+        Placement.bank_name,
+        Placement.starting_salary,
+        Placement.fee_percentage,
+        Placement.fee_amount,
+        Placement.commission_amount,
+        Placement.commission_rate_used,
+        Placement.commission_breakdown,
+        Placement.placement_date,
+        Placement.employee_id,
+        Employee.name.label('employee_name')
+    ).outerjoin(Employee, Placement.employee)
 
 # Routes
 
@@ -52,23 +157,28 @@ def parse_date(date_string):
 defaults={'path': ''})
 @app.route('/<path:path>')
 def serve_react(path):
-    build_path = os.path.join(app.static_folder, path)
-    if path != "" and os.path.exists(build_path):
-        return send_from_directory(app.static_folder, path)
-    else:
-        return send_from_directory(app.static_folder, 'index.html')
+    # Build files are served by WhiteNoise; anything reaching here is a client-side route
+    return send_from_directory(BUILD_FOLDER, 'index.html')
 
 
-
-@app.route('/')
-def index():
-    return jsonify({"message": "Commission Tracker API"})
+@app.route('/api/health')
+def health():
+    return jsonify({'ok': True})
 
 # Employee Routes
 @app.route('/api/employees', methods=['GET'])
 def get_employees():
-    employees = Employee.query.all()
-    return jsonify([employee.to_dict() for employee in employees])
+    rows = db.session.execute(select(
+        Employee.id,
+        Employee.name,
+        Employee.email,
+        Employee.phone,
+        Employee.cumulative_fees,
+        Employee.cumulative_commission,
+        Employee.commission_structure,
+        Employee.created_at
+    )).mappings().all()
+    return jsonify([dict(row) for row in rows])
 
 @app.route('/api/employees/<int:id>', methods=['GET'])
 def get_employee(id):
@@ -91,6 +201,7 @@ def create_employee():
     
     db.session.add(employee)
     db.session.commit()
+    cache.delete(DASHBOARD_CACHE_KEY)
     
     return jsonify(employee.to_dict()), 201
 
@@ -107,6 +218,7 @@ def update_employee(id):
         employee.commission_structure = data['commission_structure']
     
     db.session.commit()
+    cache.delete(DASHBOARD_CACHE_KEY)
     return jsonify(employee.to_dict())
 
 @app.route('/api/employees/<int:id>', methods=['DELETE'])
@@ -115,19 +227,14 @@ def delete_employee(id):
 
     db.session.delete(employee)
     db.session.commit()
+    cache.delete(DASHBOARD_CACHE_KEY)
     return jsonify({"message": "Employee deleted"})
 
 # Placement Routes
 @app.route('/api/placements', methods=['GET'])
 def get_placements():
-    placements = Placement.query.all()
-    result = []
-    for placement in placements:
-        placement_dict = placement.to_dict()
-        placement_dict['employee_name'] = placement.employee.name if placement.employee else None
-        result.append(placement_dict)
-    
-    return jsonify(result)
+    rows = db.session.execute(placement_listing()).mappings().all()
+    return jsonify([dict(row) for row in rows])
 
 
 @app.route('/api/placements/<int:id>', methods=['DELETE'])
@@ -136,25 +243,25 @@ def delete_placement(id):
 
     db.session.delete(placement)
     db.session.commit()
+    cache.delete(DASHBOARD_CACHE_KEY)
     return jsonify({"message": "Placement deleted"})
 
 
 
-@app.route('/api/placements', methods=['POST'])
-def create_placement():
-    data = request.json
-    
-    # Parse date
-    placement_date = parse_date(data.get('placement_date'))
-    
+# Employee columns read when recording placements; skips contact details and created_at
+COMMISSION_COLUMNS = load_only(
+    Employee.id,
+    Employee.name,
+    Employee.cumulative_fees,
+    Employee.cumulative_commission,
+    Employee.commission_structure
+)
+
+def record_placement(employee, data, placement_date):
+    """Add a placement and its earning to the session and advance the employee's totals"""
     # Calculate fee amount
     fee_amount = float(data['starting_salary']) * (float(data['fee_percentage']) / 100)
     
-    # Get employee
-    employee = Employee.query.get(data['employee_id'])
-    if not employee:
-        return jsonify({"error": "Employee not found"}), 404
-    
     # Calculate commission based on cumulative FEES (NEW)
     commission_result = employee.calculate_commission_based_on_fees(fee_amount)
     
@@ -164,29 +271,46 @@ def create_placement():
         bank_name=data['bank_name'],
         starting_salary=float(data['starting_salary']),
         fee_percentage=float(data['fee_percentage']) / 100,
-        employee_id=data['employee_id'],
+        fee_amount=fee_amount,
+        employee_id=employee.id,
         placement_date=placement_date,
         commission_amount=commission_result['total_commission'],
         commission_rate_used=commission_result['new_rate'],
         commission_breakdown=commission_result['breakdown']
     )
     
-    db.session.add(placement)
-    
-    # Create earning record
+    # Create earning record - linked through the relationship so both rows
+    # are inserted in the same flush
     earning = Earning(
         amount=commission_result['total_commission'],
-        placement_id=placement.id,
-        employee_id=data['employee_id']
+        placement=placement,
+        employee_id=employee.id
     )
     
-    db.session.add(earning)
+    db.session.add_all([placement, earning])
     
     # Update employee's cumulative fees AND commission (NEW)
     employee.cumulative_fees += fee_amount
     employee.cumulative_commission += commission_result['total_commission']
     
+    return placement, commission_result
+
+@app.route('/api/placements', methods=['POST'])
+def create_placement():
+    data = request.json
+    
+    # Parse date
+    placement_date = parse_date(data.get('placement_date'))
+    
+    # Get employee - only the columns needed to calculate and report commission
+    employee = db.session.get(Employee, data['employee_id'], options=[COMMISSION_COLUMNS])
+    if not employee:
+        return jsonify({"error": "Employee not found"}), 404
+    
+    placement, commission_result = record_placement(employee, data, placement_date)
+    
     db.session.commit()
+    cache.delete(DASHBOARD_CACHE_KEY)
     
     return jsonify({
         'placement': placement.to_dict(),
@@ -202,24 +326,71 @@ def create_placement():
         }
     }), 201
 
+@app.route('/api/placements/batch', methods=['POST'])
+def create_placements_batch():
+    """Create many placements in a single transaction"""
+    items = request.json
+    if not isinstance(items, list):
+        return jsonify({"error": "Expected a list of placements"}), 400
+    
+    employee_ids = {int(item['employee_id']) for item in items}
+    employees = {
+        employee.id: employee
+        for employee in Employee.query.options(COMMISSION_COLUMNS).filter(Employee.id.in_(employee_ids))
+    }
+    missing = employee_ids - employees.keys()
+    if missing:
+        return jsonify({"error": f"Employees not found: {sorted(missing)}"}), 404
+    
+    # Apply each employee's placements in date order so cumulative fee tiers
+    # are reached in the same order as individual posts would reach them
+    entries = sorted(
+        (int(item['employee_id']), parse_date(item.get('placement_date')), index, item)
+        for index, item in enumerate(items)
+    )
+    
+    results = [None] * len(items)
+    for employee_id, placement_date, index, item in entries:
+        results[index] = record_placement(employees[employee_id], item, placement_date)
+    
+    # Flush to assign ids, then serialize before commit expires the instances
+    db.session.flush()
+    response = {
+        'placements': [
+            {'placement': placement.to_dict(), 'commission_result': commission_result}
+            for placement, commission_result in results
+        ],
+        'employees': [{
+            'id': employee.id,
+            'name': employee.name,
+            'cumulative_fees': employee.cumulative_fees,
+            'cumulative_commission': employee.cumulative_commission,
+            'current_rate': employee.calculate_current_rate_based_on_fees() * 100
+        } for employee in employees.values()]
+    }
+    
+    db.session.commit()
+    cache.delete(DASHBOARD_CACHE_KEY)
+    
+    return jsonify(response), 201
+
 
 @app.route('/api/employees/reset-ytd', methods=['POST'])
 def reset_ytd_totals():
     """Reset all employees' YTD cumulative fees and commission to zero"""
     try:
-        # Get all employees
-        employees = Employee.query.all()
-        
-        reset_count = 0
-        for employee in employees:
-            employee.cumulative_fees = 0.0
-            employee.cumulative_commission = 0.0
+        # Reset every employee in a single UPDATE
+        reset_count = Employee.query.update(
+            {Employee.cumulative_fees: 0.0, Employee.cumulative_commission: 0.0},
+            synchronize_session=False
+        )
         db.session.commit()
+        cache.delete(DASHBOARD_CACHE_KEY)
         
         return jsonify({
             'message': f'Successfully reset YTD totals for {reset_count} employees',
             'reset_count': reset_count,
-            'timestamp': datetime.utcnow().isoformat()
+            'timestamp': datetime.utcnow()
         }), 200
         
     except Exception as e:
@@ -236,7 +407,8 @@ def calculate_commission_preview(id):
     data = request.json
     
     fee_amount = float(data.get('fee_amount', 0))
-    commission_result = employee.calculate_commission_based_on_fees(fee_amount)
+    # The client renders its own segment descriptions for previews
+    commission_result = employee.calculate_commission_based_on_fees(fee_amount, include_description=False)
     
     return jsonify({
         'employee': {
@@ -251,23 +423,24 @@ def calculate_commission_preview(id):
 
 # Dashboard/Report Routes
 @app.route('/api/dashboard/summary', methods=['GET'])
+@cache.cached(timeout=30, key_prefix=DASHBOARD_CACHE_KEY)
 def get_dashboard_summary():
     total_placements = Placement.query.count()
     total_employees = Employee.query.count()
     
-    total_fees = db.session.query(db.func.sum(Placement.starting_salary * Placement.fee_percentage)).scalar() or 0
-    total_commissions = db.session.query(db.func.sum(Earning.amount)).scalar() or 0
+    total_fees = db.session.query(func.sum(Placement.fee_amount)).scalar() or 0
+    total_commissions = db.session.query(func.sum(Earning.amount)).scalar() or 0
     
     # Get recent placements with employee names
-    recent_placements = Placement.query.order_by(Placement.placement_date.desc()).limit(5).all()
+    recent_placements = db.session.execute(
+        placement_listing().order_by(Placement.placement_date.desc()).limit(5)
+    ).mappings().all()
     
     # Format placements with employee names
     placements_with_employees = []
-    for placement in recent_placements:
-        placement_dict = placement.to_dict()
-        if placement.employee:
-            placement_dict['employee_name'] = placement.employee.name
-        else:
+    for row in recent_placements:
+        placement_dict = dict(row)
+        if placement_dict['employee_name'] is None:
             placement_dict['employee_name'] = 'Unknown'
         placements_with_employees.append(placement_dict)
     
@@ -281,31 +454,74 @@ def get_dashboard_summary():
 
 @app.route('/api/employees/<int:id>/earnings', methods=['GET'])
 def get_employee_earnings(id):
-    employee = Employee.query.get_or_404(id)
-    
-    earnings = Earning.query.filter_by(employee_id=id).all()
-    placements = Placement.query.filter_by(employee_id=id).all()
-    
-    cumulative_earnings = []
-    running_total = 0
-    
-    for earning in sorted(earnings, key=lambda x: x.calculated_at):
-        running_total += earning.amount
-        cumulative_earnings.append({
-            'date': earning.calculated_at.isoformat(),
-            'amount': earning.amount,
-            'cumulative': running_total,
-            'placement_id': earning.placement_id
-        })
+    loader_options = [selectinload(Employee.earnings), selectinload(Employee.placements)]
+    # Surface any stray lazy loads while developing
+    if app.debug or app.testing:
+        loader_options.append(raiseload('*'))
+    employee = Employee.query.options(*loader_options).get_or_404(id)
+    
+    earnings = employee.earnings
+    placements = employee.placements
+    
+    # Running total computed by the database as a window function
+    order = (Earning.calculated_at, Earning.id)
+    rows = db.session.execute(
+        select(
+            Earning.calculated_at,
+            Earning.amount,
+            Earning.placement_id,
+            func.sum(Earning.amount).over(order_by=order).label('cumulative')
+        )
+        .where(Earning.employee_id == id)
+        .order_by(*order)
+    ).all()
+    
+    cumulative_earnings = [{
+        'date': row.calculated_at,
+        'amount': row.amount,
+        'cumulative': row.cumulative,
+        'placement_id': row.placement_id
+    } for row in rows]
+    running_total = cumulative_earnings[-1]['cumulative'] if cumulative_earnings else 0
     
     return jsonify({
         'employee': employee.to_dict(),
         'earnings': [e.to_dict() for e in earnings],
         'cumulative_earnings': cumulative_earnings,
         'total_earned': running_total,
-        'current_commission_rate': employee.calculate_current_rate() * 100,
+        'current_commission_rate': employee.calculate_current_rate_based_on_fees() * 100,
         'placements': [p.to_dict() for p in placements]
     })
 
+@app.cli.command('reconcile-totals')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Start of the YTD period; must match the date reset-ytd was last run '
+                   '(defaults to January 1st of the current year, which is only right '
+                   'when resets happen at the start of the year)')
+def reconcile_totals(since):
+    """Recompute every employee's YTD cumulative fees and commission from stored placements"""
+    # Both totals are filtered on the same placement date so the fees that drive
+    # the tier rate always line up with the commission they produced
+    if since is None:
+        since = datetime(datetime.utcnow().year, 1, 1)
+    
+    fees = (
+        select(func.coalesce(func.sum(Placement.fee_amount), 0.0))
+        .where(Placement.employee_id == Employee.id, Placement.placement_date >= since)
+        .scalar_subquery()
+    )
+    commission = (
+        select(func.coalesce(func.sum(Placement.commission_amount), 0.0))
+        .where(Placement.employee_id == Employee.id, Placement.placement_date >= since)
+        .scalar_subquery()
+    )
+    
+    updated = Employee.query.update(
+        {Employee.cumulative_fees: fees, Employee.cumulative_commission: commission},
+        synchronize_session=False
+    )
+    db.session.commit()
+    click.echo(f'Reconciled YTD totals for {updated} employees since {since.date().isoformat()}')
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -1,3 +1,4 @@
+from bisect import bisect_right
 from datetime import datetime
 from database import db
 
@@ -17,8 +18,8 @@ class Employee(db.Model):
     commission_structure = db.Column(db.JSON, nullable=False)
     
     # Relationships
-    placements = db.relationship('Placement', backref='employee', lazy=True, cascade="all, delete-orphan")
-    earnings = db.relationship('Earning', backref='employee', lazy=True, cascade="all, delete-orphan")
+    placements = db.relationship('Placement', back_populates='employee', lazy=True, cascade="all, delete-orphan")
+    earnings = db.relationship('Earning', back_populates='employee', lazy=True, cascade="all, delete-orphan")
     
     def __repr__(self):
         return f'<Employee {self.name}>'
@@ -32,147 +33,70 @@ class Employee(db.Model):
             'cumulative_fees': self.cumulative_fees,
             'cumulative_commission': self.cumulative_commission,
             'commission_structure': self.commission_structure,
-            'created_at': self.created_at.isoformat()
+            'created_at': self.created_at
         }
     
+    @property
+    def _tier_arrays(self):
+        """Tier thresholds and rates sorted by threshold, memoized per commission structure"""
+        structure = self.commission_structure
+        cached = getattr(self, '_tier_cache', None)
+        # Re-sort only when commission_structure has been reassigned or reloaded
+        if cached is None or cached[0] is not structure:
+            tiers = sorted(structure.get('tiers', []), key=lambda x: x['threshold'])
+            cached = (structure, [tier['threshold'] for tier in tiers], [tier['rate'] for tier in tiers])
+            self._tier_cache = cached
+        return cached[1], cached[2]
+    
+    def _rate_at_fees(self, cumulative_fees):
+        """Commission rate (cap applied) once cumulative fees reach the given amount"""
+        structure = self.commission_structure
+        thresholds, rates = self._tier_arrays
+        return _tier_rate(cumulative_fees, thresholds, rates, structure.get('base_rate', 0.0), structure.get('cap'))
+    
     def calculate_current_rate_based_on_fees(self):
         """Calculate current commission rate based on cumulative fees"""
-        structure = self.commission_structure
-        cumulative_fees = self.cumulative_fees
-        
-        # Start with base rate
-        current_rate = structure.get('base_rate', 0.0)
-        
-        # Check tiers - apply when cumulative fees REACHES threshold
-        for tier in sorted(structure.get('tiers', []), key=lambda x: x['threshold']):
-            if cumulative_fees >= tier['threshold']:
-                current_rate = tier['rate']
-        
-        # Apply cap if exists
-        if structure.get('cap') is not None:
-            current_rate = min(current_rate, structure['cap'])
-        
-        return current_rate
+        return self._rate_at_fees(self.cumulative_fees)
     
-    def calculate_commission_based_on_fees(self, fee_amount):
+    def calculate_commission_based_on_fees(self, fee_amount, include_description=True):
         """
         Calculate commission where tiers are based on CUMULATIVE FEES
         Tiers apply when cumulative fees REACH OR EXCEED the threshold
+        
+        Pass include_description=False to skip formatting the human-readable
+        'description' of each breakdown segment
         """
         structure = self.commission_structure
         cumulative_fees_before = self.cumulative_fees
-        remaining_fee = fee_amount
-        total_commission = 0
-        breakdown = []
         
         # Get commission structure
+        thresholds, rates = self._tier_arrays
         base_rate = structure.get('base_rate', 0.0)
-        tiers = sorted(structure.get('tiers', []), key=lambda x: x['threshold'])
         cap = structure.get('cap')
         
-        # Start with current position in fees
-        current_fee_position = cumulative_fees_before
-        
-        # Determine starting rate (tier applies when reaching fee threshold)
-        current_rate = base_rate
-        for tier in tiers:
-            if current_fee_position >= tier['threshold']:
-                current_rate = tier['rate']
+        total_commission, current_fee_position, segments = _commission_segments(
+            cumulative_fees_before, fee_amount, thresholds, rates, base_rate, cap
+        )
         
-        # Apply cap if exists
-        if cap is not None:
-            current_rate = min(current_rate, cap)
-        
-        # Process the fee amount
-        while remaining_fee > 0:
-            # Find next fee threshold (if any)
-            next_threshold = None
-            next_rate = current_rate
-            
-            # Look for the next tier threshold GREATER than current fee position
-            for tier in tiers:
-                if tier['threshold'] > current_fee_position:
-                    next_threshold = tier['threshold']
-                    next_rate = tier['rate']
-                    break
-            
-            # Effective rate (respecting cap)
-            effective_rate = min(current_rate, cap) if cap is not None else current_rate
-            
-            if next_threshold is not None:
-                # Calculate fee space until next threshold
-                fee_space = next_threshold - current_fee_position
-                
-                if fee_space <= remaining_fee:
-                    # This segment will reach the next threshold
-                    segment_fee = fee_space
-                    segment_commission = segment_fee * effective_rate
-                    
-                    breakdown.append({
-                        'segment': len(breakdown) + 1,
-                        'from_cumulative_fees': current_fee_position,
-                        'to_cumulative_fees': next_threshold,
-                        'fee_amount': segment_fee,
-                        'rate': effective_rate,
-                        'commission': segment_commission,
-                        'description': f"${segment_fee:,.2f} at {effective_rate*100:.1f}% (reaches ${next_threshold:,.0f} threshold)"
-                    })
-                    
-                    total_commission += segment_commission
-                    current_fee_position = next_threshold
-                    remaining_fee -= segment_fee
-                    
-                    # Move to next tier rate
-                    current_rate = next_rate
-                    
-                    # Re-apply cap for new rate
-                    if cap is not None:
-                        current_rate = min(current_rate, cap)
-                else:
-                    # Remaining fee stays in current tier
-                    segment_fee = remaining_fee
-                    segment_commission = segment_fee * effective_rate
-                    
-                    breakdown.append({
-                        'segment': len(breakdown) + 1,
-                        'from_cumulative_fees': current_fee_position,
-                        'to_cumulative_fees': current_fee_position + segment_fee,
-                        'fee_amount': segment_fee,
-                        'rate': effective_rate,
-                        'commission': segment_commission,
-                        'description': f"${segment_fee:,.2f} at {effective_rate*100:.1f}%"
-                    })
-                    
-                    total_commission += segment_commission
-                    current_fee_position += segment_fee
-                    remaining_fee = 0
-            else:
-                # No more thresholds - we're at the highest tier
-                segment_fee = remaining_fee
-                segment_commission = segment_fee * effective_rate
-                
-                breakdown.append({
-                    'segment': len(breakdown) + 1,
-                    'from_cumulative_fees': current_fee_position,
-                    'to_cumulative_fees': current_fee_position + segment_fee,
-                    'fee_amount': segment_fee,
-                    'rate': effective_rate,
-                    'commission': segment_commission,
-                    'description': f"${segment_fee:,.2f} at {effective_rate*100:.1f}%"
-                })
-                
-                total_commission += segment_commission
-                current_fee_position += segment_fee
-                remaining_fee = 0
+        breakdown = []
+        for number, (from_fees, to_fees, segment_fee, rate, commission, reaches_threshold) in enumerate(segments, 1):
+            segment = {
+                'segment': number,
+                'from_cumulative_fees': from_fees,
+                'to_cumulative_fees': to_fees,
+                'fee_amount': segment_fee,
+                'rate': rate,
+                'commission': commission
+            }
+            if include_description:
+                description = f"${segment_fee:,.2f} at {rate*100:.1f}%"
+                if reaches_threshold:
+                    description += f" (reaches ${to_fees:,.0f} threshold)"
+                segment['description'] = description
+            breakdown.append(segment)
         
         # Calculate new rate based on final fee position
-        new_rate = base_rate
-        for tier in tiers:
-            if current_fee_position >= tier['threshold']:
-                new_rate = tier['rate']
-        
-        if cap is not None:
-            new_rate = min(new_rate, cap)
+        new_rate = _tier_rate(current_fee_position, thresholds, rates, base_rate, cap)
         
         return {
             'total_commission': total_commission,
@@ -185,6 +109,56 @@ class Employee(db.Model):
         }
 
 
+def _tier_rate(cumulative_fees, thresholds, rates, base_rate, cap):
+    """Rate of the last tier whose threshold has been REACHED (else base rate), capped"""
+    index = bisect_right(thresholds, cumulative_fees) - 1
+    rate = rates[index] if index >= 0 else base_rate
+    return min(rate, cap) if cap is not None else rate
+
+
+def _commission_segments(cumulative_fees, fee_amount, thresholds, rates, base_rate, cap):
+    """
+    Numeric core of the tiered commission calculation, free of dict/string work
+    Returns (total_commission, final_fee_position, segments) where each segment is a
+    (from_fees, to_fees, fee_amount, rate, commission, reaches_threshold) tuple
+    """
+    current_fee_position = cumulative_fees
+    remaining_fee = fee_amount
+    total_commission = 0
+    segments = []
+    
+    current_rate = _tier_rate(current_fee_position, thresholds, rates, base_rate, cap)
+    # Index of the next tier threshold GREATER than current fee position
+    next_index = bisect_right(thresholds, current_fee_position)
+    
+    while remaining_fee > 0:
+        if next_index < len(thresholds) and thresholds[next_index] - current_fee_position <= remaining_fee:
+            # This segment will reach the next threshold
+            next_threshold = thresholds[next_index]
+            segment_fee = next_threshold - current_fee_position
+            segment_commission = segment_fee * current_rate
+            segments.append((current_fee_position, next_threshold, segment_fee, current_rate, segment_commission, True))
+            
+            total_commission += segment_commission
+            current_fee_position = next_threshold
+            remaining_fee -= segment_fee
+            
+            # Move to next tier rate
+            current_rate = _tier_rate(current_fee_position, thresholds, rates, base_rate, cap)
+            next_index = bisect_right(thresholds, current_fee_position)
+        else:
+            # Remaining fee stays in current tier
+            segment_fee = remaining_fee
+            segment_commission = segment_fee * current_rate
+            segments.append((current_fee_position, current_fee_position + segment_fee, segment_fee, current_rate, segment_commission, False))
+            
+            total_commission += segment_commission
+            current_fee_position += segment_fee
+            remaining_fee = 0
+    
+    return total_commission, current_fee_position, segments
+
+
 class YearlySummary(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     year = db.Column(db.Integer, nullable=False)
@@ -203,7 +177,7 @@ class YearlySummary(db.Model):
             'total_placements': self.total_placements,
             'total_fees': self.total_fees,
             'total_commissions': self.total_commissions,
-            'recorded_at': self.recorded_at.isoformat()
+            'recorded_at': self.recorded_at
         }
 
 
@@ -219,7 +193,9 @@ class Placement(db.Model):
     bank_name = db.Column(db.String(100), nullable=False)
     starting_salary = db.Column(db.Float, nullable=False)
     fee_percentage = db.Column(db.Float, nullable=False)
-    placement_date = db.Column(db.DateTime, default=datetime.utcnow)
+    # starting_salary * fee_percentage, stored so totals don't recompute it per row
+    fee_amount = db.Column(db.Float, index=True)
+    placement_date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     placement_year = db.Column(db.Integer, default=lambda: datetime.utcnow().year)
     
@@ -229,13 +205,15 @@ class Placement(db.Model):
     commission_breakdown = db.Column(db.JSON)
     
     # Relationships
-    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id', ondelete='CASCADE'), nullable=False)
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id', ondelete='CASCADE'), nullable=False, index=True)
+    employee = db.relationship('Employee', back_populates='placements')
+    earnings_entries = db.relationship('Earning', back_populates='placement')
     
     def __repr__(self):
         return f'<Placement {self.candidate_name} at {self.bank_name}>'
     
     def to_dict(self):
-        fee_amount = self.starting_salary * self.fee_percentage
+        fee_amount = self.get_fee_amount()
         return {
             'id': self.id,
             'candidate_name': self.candidate_name,
@@ -246,21 +224,27 @@ class Placement(db.Model):
             'commission_amount': self.commission_amount,
             'commission_rate_used': self.commission_rate_used,
             'commission_breakdown': self.commission_breakdown,
-            'placement_date': self.placement_date.isoformat(),
+            'placement_date': self.placement_date,
             'employee_id': self.employee_id
         }
     
     def get_fee_amount(self):
+        if self.fee_amount is not None:
+            return self.fee_amount
         return self.starting_salary * self.fee_percentage
 
 class Earning(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     amount = db.Column(db.Float, nullable=False)
-    placement_id = db.Column(db.Integer, db.ForeignKey('placement.id'))
+    placement_id = db.Column(db.Integer, db.ForeignKey('placement.id'), index=True)
     employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), nullable=False)
     calculated_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    placement = db.relationship('Placement', backref='earnings_entries')
+    # Per-employee earnings in date order (also serves plain employee_id lookups)
+    __table_args__ = (db.Index('ix_earning_emp_calc', 'employee_id', 'calculated_at'),)
+    
+    employee = db.relationship('Employee', back_populates='earnings')
+    placement = db.relationship('Placement', back_populates='earnings_entries')
     
     def __repr__(self):
         return f'<Earning ${self.amount} for Employee {self.employee_id}>'
@@ -271,5 +255,5 @@ class Earning(db.Model):
             'amount': self.amount,
             'placement_id': self.placement_id,
             'employee_id': self.employee_id,
-            'calculated_at': self.calculated_at.isoformat()
+            'calculated_at': self.calculated_at
         }
\ No newline at end of file